@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+#
+# Copyright (c) 2026 Joshua Watt
+#
+# SPDX-License-Identifier: MIT
+"""Content-addressed on-disk cache for generation artifacts"""
+
+import hashlib
+import os
+import pickle  # nosec B403
+import tempfile
+from pathlib import Path
+
+from .version import VERSION
+
+THIS_DIR = Path(__file__).parent
+
+
+def source_hash(path=THIS_DIR):
+    """
+    Returns a hash of the Python source files in path, which is the
+    shacl2code package by default. This is part of the key of cached output,
+    so that changing the code that renders it (e.g. in a development checkout)
+    invalidates the output even if the version is unchanged
+    """
+    h = hashlib.sha256()
+    path = Path(path)
+    for f in sorted(path.rglob("*.py")):
+        for p in (f.relative_to(path).as_posix().encode("utf-8"), f.read_bytes()):
+            h.update(len(p).to_bytes(8, "little"))
+            h.update(p)
+    return h.hexdigest()
+
+
+class Cache(object):
+    """
+    On-disk cache
+
+    Entries are stored in files named by a hash of their key, so an entry is
+    only found again if every part of the key (e.g. the content of an input
+    file) is unchanged. The shacl2code version is always part of the key so
+    that upgrading invalidates all entries
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    @staticmethod
+    def key(*parts):
+        h = hashlib.sha256()
+        for p in (VERSION,) + parts:
+            if isinstance(p, str):
+                p = p.encode("utf-8")
+            elif not isinstance(p, bytes):
+                p = repr(p).encode("utf-8")
+            h.update(len(p).to_bytes(8, "little"))
+            h.update(p)
+        return h.hexdigest()
+
+    def __entry(self, kind, key):
+        return self.path / f"{kind}-{key}.pickle"
+
+    def get(self, kind, key):
+        """
+        Returns the cached object of the given kind for key, or None if there
+        is no (readable) entry. An entry that cannot be loaded is removed
+        """
+        path = self.__entry(kind, key)
+        try:
+            f = path.open("rb")
+        except OSError:
+            return None
+
+        try:
+            with f:
+                # The cache directory is chosen by the user running
+                # shacl2code and only ever written by it, so it is trusted
+                # the same as the installed code
+                return pickle.load(f)  # nosec B301
+        except Exception:
+            # A truncated entry, or one written by an incompatible version,
+            # can fail with almost any exception. Treat it as a miss
+            try:
+                path.unlink()
+            except OSError:
+                pass
+            return None
+
+    def put(self, kind, key, obj):
+        """
+        Stores obj as the entry of the given kind for key. The entry is
+        written atomically, so concurrent readers never see a partial entry
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path, prefix=f".{kind}-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.__entry(kind, key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
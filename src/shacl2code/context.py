@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: MIT
 """JSON-LD context processing and IRI compaction/expansion utilities"""
 
+import bisect
 import re
 from contextlib import contextmanager
 
@@ -13,6 +14,107 @@ def foreach_context(contexts):
             yield name, value
 
 
+class ContextIndex(object):
+    """
+    Index of a list of contexts
+
+    Maps term names to the context entries that define them for expansion,
+    and expanded IRIs and IRI prefixes back to the context entries that can be
+    used to compact them. This means expanding or compacting a term only needs
+    to look at the few entries that might match instead of every entry of
+    every context
+    """
+
+    def __init__(self, contexts, expand_iri):
+        self.entries = list(foreach_context(contexts))
+        self.expand_iri = expand_iri
+
+        self.vocabs = []
+        self.bases = []
+        # Maps each name to the (sorted) indexes of the entries that define it
+        # with a non-empty value
+        self.names = {}
+        for idx, (name, value) in enumerate(self.entries):
+            if name == "@vocab":
+                self.vocabs.append(value)
+                continue
+
+            if name == "@base":
+                self.bases.append(value)
+                continue
+
+            if isinstance(value, dict):
+                value = value.get("@id", "")
+
+            if value:
+                self.names.setdefault(name, []).append(idx)
+
+        # The reverse maps expand the values of the entries, which requires
+        # the index of the contexts used for expansion, so they are only
+        # created when first needed
+        self.always = None
+        self.exact = {}
+        self.slash_prefix = {}
+        self.colon_prefix = {}
+
+    def value(self, idx):
+        value = self.entries[idx][1]
+        if isinstance(value, dict):
+            return value.get("@id", "")
+        return value
+
+    def find_name(self, name, start=0):
+        """
+        Returns the index of the first entry at or after start that defines
+        name, or None if there is no such entry
+        """
+        indexes = self.names.get(name, [])
+        i = bisect.bisect_left(indexes, start)
+        if i < len(indexes):
+            return indexes[i]
+        return None
+
+    def __build_reverse(self):
+        self.always = []
+        for idx, (name, value) in enumerate(self.entries):
+            if name in ("@vocab", "@base"):
+                self.always.append(idx)
+                continue
+
+            if isinstance(value, dict):
+                value = value.get("@id", "")
+
+            if not isinstance(value, str):
+                self.always.append(idx)
+                continue
+
+            expanded = self.expand_iri(value)
+            self.exact.setdefault(expanded, []).append(idx)
+            if value.endswith("/"):
+                self.slash_prefix.setdefault(value, []).append(idx)
+            if expanded.endswith("/"):
+                self.colon_prefix.setdefault(value, []).append(idx)
+
+    def candidates(self, term, *, prefix=False):
+        """
+        Returns the (name, value) context entries that could compact term, in
+        the order they appear in the contexts
+        """
+        if self.always is None:
+            self.__build_reverse()
+
+        idx = set(self.always)
+        idx.update(self.exact.get(term, ()))
+        if prefix:
+            for i, c in enumerate(term):
+                if c == "/":
+                    idx.update(self.slash_prefix.get(term[: i + 1], ()))
+                elif c == ":":
+                    idx.update(self.colon_prefix.get(term[:i], ()))
+
+        return [self.entries[i] for i in sorted(idx)]
+
+
 class Context(object):
     def __init__(self, contexts=None):
         if contexts is None:
@@ -26,6 +128,7 @@ class Context(object):
         self.__compacted_iris = {}
         self.__compacted_ids = {}
         self.__compacted_vocabs = {}
+        self.__indexes = {}
 
     @contextmanager
     def vocab_push(self, vocab):
@@ -62,11 +165,19 @@ class Context(object):
 
         return contexts
 
+    def __get_index(self, *, vocab=False):
+        # The vocabulary contexts depend on the entire vocabulary stack
+        key = tuple(self.__vocabs) if vocab else None
+        if key not in self.__indexes:
+            contexts = self.__get_vocab_contexts() if vocab else self.contexts
+            self.__indexes[key] = ContextIndex(contexts, self.expand_iri)
+        return self.__indexes[key]
+
     def __choose_possible(
         self,
         term,
         default,
-        contexts,
+        index,
         *,
         vocab=False,
         base=False,
@@ -85,7 +196,7 @@ class Context(object):
 
         def helper(term):
             possible = set()
-            for name, value in foreach_context(contexts):
+            for name, value in index.candidates(term, prefix=prefix):
                 if name == "@vocab":
                     if vocab:
                         possible |= remove_prefix(term, value)
@@ -143,7 +254,7 @@ class Context(object):
             self.__compacted_iris[iri] = self.__choose_possible(
                 iri,
                 iri,
-                self.contexts,
+                self.__get_index(),
                 exact=True,
                 prefix=True,
             )
@@ -158,7 +269,7 @@ class Context(object):
             self.__compacted_ids[_id] = self.__choose_possible(
                 _id,
                 _id,
-                self.contexts,
+                self.__get_index(),
                 base=True,
                 prefix=True,
             )
@@ -174,7 +285,7 @@ class Context(object):
             compact = self.__choose_possible(
                 term,
                 None,
-                self.__get_vocab_contexts(),
+                self.__get_index(vocab=True),
                 vocab=True,
                 exact=True,
             )
@@ -191,7 +302,7 @@ class Context(object):
         if iri not in self.__expanded_iris:
             self.__expanded_iris[iri] = self.__expand(
                 iri,
-                self.contexts,
+                self.__get_index(),
                 exact=True,
                 prefix=True,
             )
@@ -202,7 +313,7 @@ class Context(object):
         if _id not in self.__expanded_ids:
             self.__expanded_ids[_id] = self.__expand(
                 _id,
-                self.contexts,
+                self.__get_index(),
                 base=True,
                 prefix=True,
             )
@@ -215,7 +326,7 @@ class Context(object):
             if v not in self.__expanded_vocabs or term not in self.__expanded_vocabs[v]:
                 value = self.__expand(
                     term,
-                    self.__get_vocab_contexts(),
+                    self.__get_index(vocab=True),
                     vocab=True,
                     exact=True,
                 )
@@ -226,7 +337,7 @@ class Context(object):
     def __expand(
         self,
         term,
-        contexts,
+        index,
         *,
         base=False,
         exact=False,
@@ -234,50 +345,30 @@ class Context(object):
         vocab=False,
     ):
         def helper(term):
-            vocabs = []
-            bases = []
-            prefixes = []
-            exacts = []
             is_short = not re.match(r"[^:]+:", term)
 
-            for name, value in foreach_context(contexts):
-                if name == "@vocab":
-                    if vocab and is_short:
-                        vocabs.append(helper(value))
-                    continue
-
-                if name == "@base":
-                    if base and is_short:
-                        bases.append(value)
-                    continue
-
-                if isinstance(value, dict):
-                    value = value.get("@id", "")
-
-                if not value:
-                    continue
-
-                if term == name:
-                    if exact:
-                        exacts.append(helper(value))
-                    continue
-
-                if prefix:
-                    prefixes.append(name)
-
-            for e in exacts:
-                return e
+            if exact:
+                idx = index.find_name(term)
+                if idx is not None:
+                    return helper(index.value(idx))
 
-            if ":" in term:
+            if ":" in term and prefix:
                 p, suffix = term.split(":", 1)
-                for name in prefixes:
-                    if p == name:
-                        p = self.expand_iri(p)
-                        if p.endswith("/"):
-                            return p + suffix
-
-            for value in vocabs + bases:
-                return value + term
+                # If the prefix expands to something that isn't a prefix IRI,
+                # the expanded value is looked for in the rest of the entries
+                idx = index.find_name(p)
+                while idx is not None and p != term:
+                    p = self.expand_iri(p)
+                    if p.endswith("/"):
+                        return p + suffix
+                    idx = index.find_name(p, idx + 1)
+
+            if is_short:
+                if vocab and index.vocabs:
+                    return helper(index.vocabs[0]) + term
+
+                if base and index.bases:
+                    return index.bases[0] + term
 
             return term
 
@@ -4,13 +4,21 @@
 # SPDX-License-Identifier: MIT
 """Common code for language renderers"""
 
+import hashlib
+import io
 import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from contextlib import contextmanager
 from pathlib import Path
 
 import jinja2
-from jinja2 import Environment, FileSystemLoader, TemplateRuntimeError
+from jinja2 import (
+    Environment,
+    FileSystemBytecodeCache,
+    FileSystemLoader,
+    TemplateRuntimeError,
+)
 
 from markupsafe import Markup
 
@@ -26,13 +34,94 @@ class OutputFile(object):
     def __init__(self, path):
         self.path = path
 
+    def __repr__(self):
+        return f"OutputFile({self.path!r})"
+
     @contextmanager
     def open(self, mode):
         if self.path == "-":
             yield sys.stdout
-        else:
-            with open(self.path, "w") as f:
+            return
+
+        # Write to a temporary file that replaces the output once it is
+        # complete, so that a partially written file is never left behind
+        path = Path(self.path)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        try:
+            with tmp.open(mode) as f:
                 yield f
+            os.replace(tmp, path)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+
+
+def source_hash(source):
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()
+
+
+class RecordingLoader(FileSystemLoader):
+    """
+    A FileSystemLoader that records the hash of every template source it
+    loads, so that cached output can be checked against the templates it was
+    rendered from
+    """
+
+    def __init__(self, searchpath, sources):
+        super().__init__(searchpath)
+        self.sources = sources
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        self.sources[filename] = source_hash(source)
+        return source, filename, uptodate
+
+
+def get_bytecode_cache(cache_dir):
+    """
+    Returns a cache for compiled templates in cache_dir, or None if no cache
+    directory is given or it cannot be created
+    """
+    if not cache_dir:
+        return None
+    path = Path(cache_dir) / "jinja"
+    try:
+        path.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return FileSystemBytecodeCache(str(path))
+
+
+class ObjectList(object):
+    def __init__(self, objs):
+        self.__objs = objs
+        self.__by_id = {}
+        for o in objs:
+            self.__by_id.setdefault(o._id, o)
+
+    def __iter__(self):
+        return iter(self.__objs)
+
+    def get(self, _id):
+        try:
+            return self.__by_id[_id]
+        except KeyError:
+            raise KeyError(f"Object with ID {_id} not found")
+
+
+# State of a process rendering outputs for JinjaTemplateRender.output()
+worker_state = None
+
+
+def init_render_worker(render, model):
+    global worker_state
+    worker_state = (render, *render.prepare(model))
+
+
+def render_worker(template, args):
+    render, render_args, extra_env = worker_state
+    text = render.render_text(template, args, render_args, extra_env)
+    return text, dict(render.template_sources)
 
 
 @jinja2.pass_context
@@ -46,6 +135,9 @@ def include_file(ctx, name):
 class JinjaTemplateRender(object):
     def __init__(self, args):
         self.spdx_license = args.license
+        self.template_sources = {}
+        self.environments = {}
+        self.bytecode_cache = get_bytecode_cache(args.cache_dir)
 
     def get_additional_render_args(self, model):
         return {}
@@ -53,11 +145,16 @@ class JinjaTemplateRender(object):
     def get_extra_env(self):
         return {}
 
-    def render(self, template, output, *, extra_env=None, render_args=None):
-        if extra_env is None:
-            extra_env = {}  # pragma: no cover
-        if render_args is None:
-            render_args = {}  # pragma: no cover
+    def get_environment(self, template_dir):
+        """
+        Returns the environment used to render templates from template_dir
+
+        The environment is shared by all templates rendered from the same
+        directory, so that each template (and anything it includes) is only
+        loaded and compiled once per run
+        """
+        if template_dir in self.environments:
+            return self.environments[template_dir]
 
         def abort_helper(msg: str) -> None:
             raise TemplateRuntimeError(msg)
@@ -65,14 +162,27 @@ class JinjaTemplateRender(object):
         # Templates render source code (C++/Go/Python/Rust), not HTML;
         # autoescape would corrupt generated code by escaping <, >, & etc.
         env = Environment(
-            loader=FileSystemLoader([template.parent, THIS_DIR.parent])
+            loader=RecordingLoader(
+                [template_dir, THIS_DIR.parent], self.template_sources
+            ),
+            bytecode_cache=self.bytecode_cache,
         )  # nosec B701
-        for k, v in extra_env.items():
-            env.globals[k] = v
         env.globals["abort"] = abort_helper
         env.globals["SHACL2CODE"] = SHACL2CODE
         env.globals["SH"] = SH
         env.globals["SHACL2CODE_VERSION"] = VERSION
+        self.environments[template_dir] = env
+        return env
+
+    def render(self, template, output, *, extra_env=None, render_args=None):
+        if extra_env is None:
+            extra_env = {}  # pragma: no cover
+        if render_args is None:
+            render_args = {}  # pragma: no cover
+
+        env = self.get_environment(template.parent)
+        for k, v in extra_env.items():
+            env.globals[k] = v
         template = env.get_template(template.name)
 
         render = template.render(
@@ -85,44 +195,78 @@ class JinjaTemplateRender(object):
         if not render[-1] == "\n":
             output.write("\n")
 
-    def output(self, model):
+    def output_cached(self, cache, cache_key):
         """
-        Render the provided model
+        Write the output of a previous run
+
+        If the cache has an entry for the key (which must identify the model
+        and all options) and none of the templates it was rendered from have
+        changed, the cached output is written and True is returned. Otherwise
+        nothing is written and False is returned
         """
+        entry = cache.get("render", cache_key)
+        if entry is None:
+            return False
+
+        outputs = list(self.get_outputs())
+        if len(entry["outputs"]) != len(outputs):
+            return False
+
+        for filename, h in entry["templates"].items():
+            try:
+                if source_hash(Path(filename).read_bytes().decode("utf-8")) != h:
+                    return False
+            except (OSError, UnicodeDecodeError):
+                return False
+
+        for (output, _, _), text in zip(outputs, entry["outputs"]):
+            if not isinstance(output, OutputFile):
+                output = OutputFile(output)
+            with output.open("w") as f:
+                f.write(text)
+        return True
 
-        class ObjectList(object):
-            def __init__(self, objs):
-                self.__objs = objs
+    def __getstate__(self):
+        # Environments are created again as needed when unpickled in a render
+        # worker
+        state = self.__dict__.copy()
+        state["environments"] = {}
+        return state
 
-            def __iter__(self):
-                return iter(self.__objs)
+    def prepare(self, model):
+        """
+        Returns the render arguments and extra environment globals used to
+        render all outputs for the provided model
+        """
 
-            def get(self, _id):
-                for o in self.__objs:
-                    if o._id == _id:
-                        return o
-                raise KeyError(f"Object with ID {_id} not found")
+        # The closures are requested for each class (or property) in many
+        # template loops, so they are only calculated once per class
+        derived_ids = {}
+        all_derived = {}
+        all_named_individuals = {}
 
-        def get_all_derived(cls):
-            def _recurse(cls):
+        def get_derived_ids(cls):
+            if cls._id not in derived_ids:
                 result = set(cls.derived_ids)
                 for r in cls.derived_ids:
-                    result |= _recurse(classes.get(r))
-                return result
+                    result |= get_derived_ids(classes.get(r))
+                derived_ids[cls._id] = result
+            return derived_ids[cls._id]
 
-            d = list(_recurse(cls))
-            d.sort()
-            return d
+        def get_all_derived(cls):
+            if cls._id not in all_derived:
+                all_derived[cls._id] = sorted(get_derived_ids(cls))
+            return all_derived[cls._id]
 
         def get_all_named_individuals(cls):
-            ni = set(i._id for i in cls.named_individuals)
+            if cls._id not in all_named_individuals:
+                ni = set(i._id for i in cls.named_individuals)
 
-            for d in get_all_derived(cls):
-                ni |= set(i._id for i in classes.get(d).named_individuals)
+                for d in get_derived_ids(cls):
+                    ni |= set(i._id for i in classes.get(d).named_individuals)
 
-            ni = list(ni)
-            ni.sort()
-            return ni
+                all_named_individuals[cls._id] = sorted(ni)
+            return all_named_individuals[cls._id]
 
         classes = ObjectList(model.classes)
         ontologies = ObjectList(model.ontologies)
@@ -147,14 +291,65 @@ class JinjaTemplateRender(object):
             **self.get_extra_env(),
         }
 
-        for output, template, args in self.get_outputs():
-            with output.open("w") as f:
-                self.render(
-                    template,
-                    f,
-                    extra_env=env,
-                    render_args={**render_args, **args},
+        return render_args, env
+
+    def render_text(self, template, args, render_args, extra_env):
+        s = io.StringIO()
+        self.render(
+            template,
+            s,
+            extra_env=extra_env,
+            render_args={**render_args, **args},
+        )
+        return s.getvalue()
+
+    def output(self, model, *, cache=None, cache_key=None, jobs=1):
+        """
+        Render the provided model
+
+        If jobs is more than 1, up to that many outputs are rendered in
+        parallel by worker processes.
+
+        If a cache and key are provided, the output is stored so that it can
+        be written by output_cached() in a later run
+        """
+        outputs = list(self.get_outputs())
+
+        if jobs > 1 and len(outputs) > 1:
+            with ProcessPoolExecutor(
+                min(jobs, len(outputs)),
+                initializer=init_render_worker,
+                initargs=(self, model),
+            ) as executor:
+                results = list(
+                    executor.map(
+                        render_worker,
+                        [template for _, template, _ in outputs],
+                        [args for _, _, args in outputs],
+                    )
                 )
+        else:
+            render_args, env = self.prepare(model)
+            results = [
+                (self.render_text(template, args, render_args, env), {})
+                for _, template, args in outputs
+            ]
+
+        texts = []
+        for (output, _, _), (text, sources) in zip(outputs, results):
+            self.template_sources.update(sources)
+            texts.append(text)
+            if not isinstance(output, OutputFile):
+                output = OutputFile(output)
+            with output.open("w") as f:
+                f.write(text)
+
+        if cache is not None and cache_key is not None:
+            cache.put(
+                "render",
+                cache_key,
+                {"templates": self.template_sources, "outputs": texts},
+            )
 
 
 class BasicJinjaRender(JinjaTemplateRender):
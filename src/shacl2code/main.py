@@ -8,53 +8,131 @@
 import argparse
 import json
 import sys
-import urllib.request
+import time
+from contextlib import contextmanager
 from pathlib import Path
 
 import rdflib
 
+from .cache import Cache, source_hash
 from .lang import LANGUAGES
 from .model import Model
-from .urlcontext import ContextData, UrlContext
+from .urlcontext import ContextData, ContextStore, ContextUnavailableError, UrlContext
 from .version import VERSION
 
 
 def main(args=None):
     def handle_generate(parser, args):
-        graph = rdflib.Graph()
-        for inmodel in args.input:
-            if inmodel == "-":
-                if args.input_format == "auto":
-                    print("ERROR: Input format must be specified with stdin")
-                    parser.print_help()
-                    return 1
-
-                graph.parse(sys.stdin, format=args.input_format)
+        timings = []
+
+        @contextmanager
+        def profile(name):
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                timings.append((name, time.perf_counter() - start))
+
+        def report_profile():
+            if not args.profile:
+                return
+            width = max(len(name) for name, _ in timings)
+            for name, elapsed in timings:
+                print(f"{name:{width}} - {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+        cache = Cache(args.cache_dir) if args.cache_dir else None
+
+        def parse_input(graph, source):
+            if args.input_format == "auto":
+                graph.parse(source)
             else:
-                if args.input_format == "auto":
-                    graph.parse(inmodel)
-                else:
-                    graph.parse(inmodel, format=args.input_format)
+                graph.parse(source, format=args.input_format)
+
+        store = ContextStore(cache, offline=args.offline)
+        remote = list(args.context)
+        remote += [location for location, _ in args.context_url if "://" in location]
+        try:
+            with profile("context"):
+                fetched = dict(zip(remote, store.fetch_all(remote)))
+        except ContextUnavailableError as e:
+            print(f"ERROR: {e}")
+            return 1
 
         contexts = []
         for c in args.context:
-            with urllib.request.urlopen(c) as f:
-                data = json.load(f)
-            contexts.append(ContextData(data, c))
+            contexts.append(ContextData(fetched[c], c))
 
         for location, url in args.context_url:
             if "://" in location:
-                with urllib.request.urlopen(location) as f:
-                    data = json.load(f)
+                data = fetched[location]
             else:
                 with Path(location).open("r") as f:
                     data = json.load(f)
             contexts.append(ContextData(data, url))
 
-        m = Model(graph, UrlContext(contexts), is_prerelease=args.pre_release)
+        # Only local files can be identified by their content without
+        # parsing them, so stdin or URL inputs disable the cache
+        input_keys = {}
+        if cache is not None and all(i != "-" and "://" not in i for i in args.input):
+            for inmodel in args.input:
+                # The file extension is part of the key since it is used to
+                # guess the format when it is "auto"
+                input_keys[inmodel] = Cache.key(
+                    rdflib.__version__,
+                    args.input_format,
+                    Path(inmodel).suffix,
+                    Path(inmodel).read_bytes(),
+                )
 
         render = args.lang(args)
-        render.output(m)
+        render_key = None
+        if input_keys:
+            # The source of shacl2code is part of the key, since the renderers
+            # can change without the version changing
+            render_key = Cache.key(
+                source_hash(),
+                *input_keys.values(),
+                [(c.url, json.dumps(c.context, sort_keys=True)) for c in contexts],
+                sorted(
+                    (k, v)
+                    for k, v in vars(args).items()
+                    if k not in ("func", "cache_dir", "jobs", "offline", "profile")
+                ),
+            )
+            with profile("cache"):
+                done = render.output_cached(cache, render_key)
+            if done:
+                report_profile()
+                return 0
+
+        graph = rdflib.Graph()
+        with profile("parse"):
+            for inmodel in args.input:
+                if inmodel == "-":
+                    if args.input_format == "auto":
+                        print("ERROR: Input format must be specified with stdin")
+                        parser.print_help()
+                        return 1
+
+                    graph.parse(sys.stdin, format=args.input_format)
+                elif inmodel in input_keys:
+                    triples = cache.get("graph", input_keys[inmodel])
+                    if triples is None:
+                        g = rdflib.Graph()
+                        parse_input(g, inmodel)
+                        triples = list(g)
+                        cache.put("graph", input_keys[inmodel], triples)
+                    graph.addN((s, p, o, graph) for s, p, o in triples)
+                else:
+                    parse_input(graph, inmodel)
+
+        with profile("model"):
+            m = Model(graph, UrlContext(contexts), is_prerelease=args.pre_release)
+
+        with profile("render"):
+            render.output(m, cache=cache, cache_key=render_key, jobs=args.jobs)
+
+        report_profile()
         return 0
 
     def handle_list(parser, args):
@@ -125,6 +203,27 @@ def main(args=None):
         action=argparse.BooleanOptionalAction,
         help="Mark the generated binding as pre-release. Overrides any ontology annotations",
     )
+    generate_parser.add_argument(
+        "--cache-dir",
+        help="Cache remote contexts, parsed input models, compiled templates and generated output in CACHE_DIR, so that unchanged inputs are not fetched, parsed, compiled or rendered again",
+    )
+    generate_parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Do not access the network. Remote contexts must already be in the --cache-dir cache",
+    )
+    generate_parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Render up to JOBS output files in parallel. Default is %(default)s",
+    )
+    generate_parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report the time taken by each generation stage on stderr",
+    )
     generate_parser.set_defaults(func=handle_generate)
 
     lang_subparser = generate_parser.add_subparsers(
@@ -5,6 +5,7 @@
 # SPDX-License-Identifier: MIT
 """SHACL model parsing and data class definitions"""
 
+import heapq
 import re
 from dataclasses import dataclass, field
 from typing import List, Optional
@@ -67,6 +68,52 @@ def remove_common_prefix(val, *cmp):
     return val[len(prefix) :]
 
 
+class GraphIndex(object):
+    """
+    Read-only index of an RDF graph
+
+    The graph is scanned once and its triples grouped by subject and
+    predicate (and by predicate and object for reverse lookups) so that the
+    many queries done while building a model are plain dictionary lookups
+    instead of store queries. The query methods mirror the rdflib.Graph
+    methods of the same name
+    """
+
+    def __init__(self, graph):
+        self.__spo = {}
+        self.__pos = {}
+        for s, p, o in graph:
+            self.__spo.setdefault(s, {}).setdefault(p, []).append(o)
+            self.__pos.setdefault(p, {}).setdefault(o, []).append(s)
+
+    def objects(self, subject, predicate):
+        return iter(self.__spo.get(subject, {}).get(predicate, []))
+
+    def subjects(self, predicate, obj):
+        return iter(self.__pos.get(predicate, {}).get(obj, []))
+
+    def value(self, subject, predicate, default=None):
+        values = self.__spo.get(subject, {}).get(predicate)
+        if not values:
+            return default
+        return values[0]
+
+    def items(self, lst):
+        chain = set([lst])
+        while lst:
+            item = self.value(lst, RDF.first)
+            if item is not None:
+                yield item
+            lst = self.value(lst, RDF.rest)
+            if lst in chain:
+                raise ValueError("List contains a recursive rdf:rest reference")
+            chain.add(lst)
+
+    def __contains__(self, triple):
+        s, p, o = triple
+        return o in self.__spo.get(s, {}).get(p, [])
+
+
 @dataclass
 class Ontology:
     _id: str
@@ -119,6 +166,7 @@ class Class:
 class Model(object):
     def __init__(self, graph, context=None, is_prerelease=None):
         self.model = graph
+        index = GraphIndex(graph)
         self.context = context
         self.compact_ids = {}
         self.objects = {}
@@ -126,6 +174,8 @@ class Model(object):
         self.ontologies = []
         class_iris = set()
         classes_by_iri = {}
+        ancestors = {}
+        individuals_by_class = {}
 
         def int_val(v):
             if not v:
@@ -143,22 +193,47 @@ class Model(object):
                     return o
             return None
 
-        def get_inherited_value(subject, predicate, default=None):
-            def get_value(subject, predicate):
-                value = self.model.value(subject, predicate)
-                if value is not None:
-                    return value
+        def get_ancestors(subject):
+            # Returns the subject followed by all of its ancestors in the
+            # order they are searched for inherited values (depth first, in
+            # rdfs:subClassOf order). The table is filled in post-order with
+            # an explicit stack so that each class reuses the already
+            # linearized list of its parents
+            stack = [(subject, False)]
+            active = set()
+            while stack:
+                s, expanded = stack.pop()
+                if s in ancestors or (s in active and not expanded):
+                    continue
 
-                for parent in self.model.objects(subject, RDFS.subClassOf):
-                    value = get_value(parent, predicate)
-                    if value is not None:
-                        return value
+                parents = list(index.objects(s, RDFS.subClassOf))
+                if not expanded:
+                    active.add(s)
+                    stack.append((s, True))
+                    for p in reversed(parents):
+                        if p not in ancestors and p not in active:
+                            stack.append((p, False))
+                    continue
 
-                return None
+                active.discard(s)
+                order = [s]
+                seen = {s}
+                for p in parents:
+                    # A parent that is still active is part of a cycle and
+                    # does not have a linearization yet
+                    for a in ancestors.get(p, [p]):
+                        if a not in seen:
+                            seen.add(a)
+                            order.append(a)
+                ancestors[s] = order
 
-            value = get_value(subject, predicate)
-            if value is not None:
-                return value
+            return ancestors[subject]
+
+        def get_inherited_value(subject, predicate, default=None):
+            for s in get_ancestors(subject):
+                value = index.value(s, predicate)
+                if value is not None:
+                    return value
             return default
 
         def set_prop_range(p, range_id):
@@ -170,17 +245,12 @@ class Model(object):
 
         def get_named_individuals(cls_iri):
             members = []
-            for member_iri in self.model.subjects(RDF.type, cls_iri):
-                if (member_iri, RDF.type, OWL.NamedIndividual) not in self.model:
-                    continue
-
+            for member_iri in individuals_by_class.get(cls_iri, []):
                 members.append(
                     Individual(
                         _id=str(member_iri),
                         varname=remove_common_prefix(member_iri, cls_iri).lstrip("/"),
-                        comment=str(
-                            self.model.value(member_iri, RDFS.comment, default="")
-                        ),
+                        comment=str(index.value(member_iri, RDFS.comment, default="")),
                         ontology=get_ontology(member_iri),
                     )
                 )
@@ -192,10 +262,10 @@ class Model(object):
                 s,
                 RDF.type,
                 URIRef("http://spdx.invalid./AbstractClass"),
-            ) in self.model:
+            ) in index:
                 return True
 
-            if bool(self.model.value(s, SHACL2CODE.isAbstract, default=False)):
+            if bool(index.value(s, SHACL2CODE.isAbstract, default=False)):
                 return True
 
             return False
@@ -218,12 +288,12 @@ class Model(object):
                 return is_prerelease
 
             # 2) sh-to-code:isPreRelease
-            val = self.model.value(onto_iri, SHACL2CODE.isPreRelease)
+            val = index.value(onto_iri, SHACL2CODE.isPreRelease)
             if val is not None:
                 return bool(val)
 
             adms_statuses = list(
-                self.model.objects(onto_iri, URIRef("http://www.w3.org/ns/adms#status"))
+                index.objects(onto_iri, URIRef("http://www.w3.org/ns/adms#status"))
             )
             if adms_statuses:
                 semic = [
@@ -254,9 +324,7 @@ class Model(object):
 
             # 5) bibo:status (Bibliographic Ontology)
             bibo_statuses = list(
-                self.model.objects(
-                    onto_iri, URIRef("http://purl.org/ontology/bibo/status")
-                )
+                index.objects(onto_iri, URIRef("http://purl.org/ontology/bibo/status"))
             )
             if bibo_statuses:
                 return any(
@@ -266,20 +334,16 @@ class Model(object):
 
             # 6) schema:creativeWorkStatus
             schema_statuses = list(
-                self.model.objects(
-                    onto_iri, URIRef("http://schema.org/creativeWorkStatus")
-                )
+                index.objects(onto_iri, URIRef("http://schema.org/creativeWorkStatus"))
             ) or list(
-                self.model.objects(
-                    onto_iri, URIRef("https://schema.org/creativeWorkStatus")
-                )
+                index.objects(onto_iri, URIRef("https://schema.org/creativeWorkStatus"))
             )
             if schema_statuses:
                 return any(str(s) in ("Draft", "Incomplete") for s in schema_statuses)
 
             # 7) vs:term_status
             vs_statuses = list(
-                self.model.objects(
+                index.objects(
                     onto_iri,
                     URIRef("http://www.w3.org/2003/06/sw-vocab-status/ns#term_status"),
                 )
@@ -288,7 +352,7 @@ class Model(object):
                 return any(str(s) in ("unstable", "testing") for s in vs_statuses)
 
             # 8) & 9) owl:versionInfo
-            versions = list(self.model.objects(onto_iri, OWL.versionInfo))
+            versions = list(index.objects(onto_iri, OWL.versionInfo))
             if versions:
                 for version in versions:
                     version_str = str(version)
@@ -303,41 +367,46 @@ class Model(object):
 
             return False
 
-        for onto_iri in self.model.subjects(RDF.type, OWL.Ontology):
-            label = str(self.model.value(onto_iri, RDFS.label, default=""))
+        for onto_iri in index.subjects(RDF.type, OWL.Ontology):
+            label = str(index.value(onto_iri, RDFS.label, default=""))
             o = Ontology(
                 _id=str(onto_iri),
                 name=label or str(onto_iri),
                 label=label,
-                comment=str(self.model.value(onto_iri, RDFS.comment, default="")),
-                version=str(self.model.value(onto_iri, OWL.versionInfo, default="")),
+                comment=str(index.value(onto_iri, RDFS.comment, default="")),
+                version=str(index.value(onto_iri, OWL.versionInfo, default="")),
                 is_prerelease=get_is_prerelease(onto_iri),
             )
             self.ontologies.append(o)
 
-        class_iris = set(self.model.subjects(RDF.type, OWL.Class)) | set(
-            self.model.subjects(RDF.type, OWL.DeprecatedClass)
+        # Bucket all named individuals by their class(es) in a single pass
+        for member_iri in index.subjects(RDF.type, OWL.NamedIndividual):
+            for cls_iri in index.objects(member_iri, RDF.type):
+                individuals_by_class.setdefault(cls_iri, []).append(member_iri)
+
+        class_iris = set(index.subjects(RDF.type, OWL.Class)) | set(
+            index.subjects(RDF.type, OWL.DeprecatedClass)
         )
         for cls_iri in class_iris:
             c = Class(
                 _id=str(cls_iri),
                 parent_ids=[
                     str(parent_iri)
-                    for parent_iri in self.model.objects(cls_iri, RDFS.subClassOf)
+                    for parent_iri in index.objects(cls_iri, RDFS.subClassOf)
                     if parent_iri in class_iris
                 ],
                 derived_ids=[],
                 clsname=self.get_class_name(cls_iri),
-                comment=str(self.model.value(cls_iri, RDFS.comment, default="")),
+                comment=str(index.value(cls_iri, RDFS.comment, default="")),
                 properties=[],
                 id_property=str_val(
                     get_inherited_value(cls_iri, SHACL2CODE.idPropertyName)
                 ),
                 node_kind=get_inherited_value(cls_iri, SH.nodeKind, SH.BlankNodeOrIRI),
-                is_extensible=bool(self.model.value(cls_iri, SHACL2CODE.isExtensible)),
+                is_extensible=bool(index.value(cls_iri, SHACL2CODE.isExtensible)),
                 is_abstract=is_abstract(cls_iri),
                 named_individuals=get_named_individuals(cls_iri),
-                deprecated=(cls_iri, RDF.type, OWL.DeprecatedClass) in self.model,
+                deprecated=(cls_iri, RDF.type, OWL.DeprecatedClass) in index,
                 ontology=get_ontology(cls_iri),
             )
 
@@ -346,15 +415,15 @@ class Model(object):
                     f"Class {c._id} has unsupported '{SH.nodeKind}' value '{c.node_kind}'"
                 )
 
-            for obj_prop in self.model.objects(cls_iri, SH.property):
-                prop = self.model.value(obj_prop, SH.path)
+            for obj_prop in index.objects(cls_iri, SH.property):
+                prop = index.value(obj_prop, SH.path)
                 if prop == RDF.type:
-                    for n in self.model.objects(obj_prop, SH["not"]):
-                        if (n, SH.hasValue, cls_iri) in self.model:
+                    for n in index.objects(obj_prop, SH["not"]):
+                        if (n, SH.hasValue, cls_iri) in index:
                             c.is_abstract = True
                     continue
 
-                varname = self.model.value(
+                varname = index.value(
                     obj_prop,
                     SH.name,
                     default=self.get_compact_id(
@@ -370,42 +439,41 @@ class Model(object):
                     p = Property(
                         varname=varname,
                         path=str(prop),
-                        comment=str(self.model.value(prop, RDFS.comment, default="")),
-                        deprecated=(prop, RDF.type, OWL.DeprecatedProperty)
-                        in self.model,
+                        comment=str(index.value(prop, RDFS.comment, default="")),
+                        deprecated=(prop, RDF.type, OWL.DeprecatedProperty) in index,
                     )
                     c.properties.append(p)
 
                 if varname < p.varname:
                     p.varname = varname
 
-                if (v := int_val(self.model.value(obj_prop, SH.maxCount))) is not None:
+                if (v := int_val(index.value(obj_prop, SH.maxCount))) is not None:
                     p.max_count = v
 
-                if (v := int_val(self.model.value(obj_prop, SH.minCount))) is not None:
+                if (v := int_val(index.value(obj_prop, SH.minCount))) is not None:
                     p.min_count = v
 
-                if in_list := self.model.value(obj_prop, SH["in"]):
-                    enum_values = set(p.enum_values) | set(self.model.items(in_list))
+                if in_list := index.value(obj_prop, SH["in"]):
+                    enum_values = set(p.enum_values) | set(index.items(in_list))
                     p.enum_values = sorted(list(enum_values))
 
-                if range_id := self.model.value(obj_prop, SH["class"]):
+                if range_id := index.value(obj_prop, SH["class"]):
                     if not set_prop_range(p, range_id):
                         raise ModelException(
                             f"Prop {prop} has unknown class restriction {range_id}"
                         )
 
-                elif range_id := self.model.value(obj_prop, SH.datatype):
+                elif range_id := index.value(obj_prop, SH.datatype):
                     p.datatype = str(range_id)
 
-                elif range_id := self.model.value(prop, RDFS.range):
+                elif range_id := index.value(prop, RDFS.range):
                     if not set_prop_range(p, range_id):
                         p.datatype = str(range_id)
 
                 else:
                     raise ModelException(f"Prop '{prop}' is missing range")
 
-                if pattern := self.model.value(obj_prop, SH.pattern):
+                if pattern := index.value(obj_prop, SH.pattern):
                     if not p.datatype:
                         raise ModelException(
                             f"Property '{prop}' is not a datatype and may not have a pattern"
@@ -431,22 +499,37 @@ class Model(object):
         self.classes.sort(key=lambda c: c._id)
         self.ontologies.sort(key=lambda o: o._id)
 
-        tmp_classes = self.classes
-        done_ids = set()
-        self.classes = []
-
-        while tmp_classes:
-            c = tmp_classes.pop(0)
+        # Order the classes so that derived classes are always written after
+        # any parent classes. Classes are visited in _id order, cycling back
+        # to the start for classes that were waiting on a parent, so a class
+        # is keyed by the pass in which it is reached once its last parent
+        # has been written, then by its _id position
+        position = {c._id: idx for idx, c in enumerate(self.classes)}
+        waiting = {c._id: len(c.parent_ids) for c in self.classes}
+        ready = [(0, position[c._id]) for c in self.classes if not c.parent_ids]
+        heapq.heapify(ready)
+        sorted_classes = []
+
+        while ready:
+            cur_pass, idx = heapq.heappop(ready)
+            c = self.classes[idx]
+            sorted_classes.append(c)
+
+            for d in c.derived_ids:
+                waiting[d] -= 1
+                if waiting[d] == 0:
+                    d_idx = position[d]
+                    heapq.heappush(
+                        ready, (cur_pass if d_idx > idx else cur_pass + 1, d_idx)
+                    )
 
-            # If any parent classes of this class are outstanding, then push it
-            # back on the end of the class list and try again. This ensures that
-            # derived classes are always written after any parent classes
-            if not all(p in done_ids for p in c.parent_ids):
-                tmp_classes.append(c)
-                continue
+        if len(sorted_classes) != len(self.classes):
+            cycle = sorted(_id for _id, count in waiting.items() if count)
+            raise ModelException(
+                f"Class hierarchy contains a cycle involving: {', '.join(cycle)}"
+            )
 
-            self.classes.append(c)
-            done_ids.add(c._id)
+        self.classes = sorted_classes
 
     def get_compact_id(self, _id, *, fallback=None):
         """
@@ -5,11 +5,19 @@
 # SPDX-License-Identifier: MIT
 """URL-based JSON-LD context loading and management"""
 
+import json
 import typing
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 
+from .cache import Cache
 from .context import Context
 
+# Maximum number of contexts fetched at the same time
+MAX_FETCH_WORKERS = 8
+
 
 @dataclass
 class ContextData:
@@ -26,3 +34,76 @@ class UrlContext(Context):
         self.urls = []
         for ctx in contexts:
             self.urls.append(ctx.url)
+
+
+class ContextUnavailableError(Exception):
+    pass
+
+
+class ContextStore(object):
+    """
+    Fetches JSON-LD context documents by URL
+
+    If a cache is provided, HTTP(S) documents are stored in it along with
+    their ETag and Last-Modified headers, and later fetches only ask the
+    server whether the stored document is still current. In offline mode, the
+    stored documents are used as-is and nothing is requested from the network
+    """
+
+    def __init__(self, cache=None, *, offline=False):
+        self.cache = cache
+        self.offline = offline
+
+    def fetch(self, url):
+        if not url.startswith(("http://", "https://")):
+            with urllib.request.urlopen(url) as f:  # nosec B310
+                return json.load(f)
+
+        key = Cache.key("context", url)
+        entry = self.cache.get("context", key) if self.cache is not None else None
+
+        if self.offline:
+            if entry is None:
+                raise ContextUnavailableError(
+                    f"Context {url} is not available offline. Fetch it once with --cache-dir first"
+                )
+            return entry["data"]
+
+        request = urllib.request.Request(url)
+        if entry is not None:
+            if entry["etag"]:
+                request.add_header("If-None-Match", entry["etag"])
+            if entry["last_modified"]:
+                request.add_header("If-Modified-Since", entry["last_modified"])
+
+        try:
+            with urllib.request.urlopen(request) as f:  # nosec B310
+                data = json.load(f)
+                headers = f.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and entry is not None:
+                return entry["data"]
+            raise
+
+        if self.cache is not None:
+            self.cache.put(
+                "context",
+                key,
+                {
+                    "etag": headers.get("ETag"),
+                    "last_modified": headers.get("Last-Modified"),
+                    "data": data,
+                },
+            )
+        return data
+
+    def fetch_all(self, urls):
+        """
+        Fetches all urls concurrently. Returns the documents in the same order
+        as urls
+        """
+        if len(urls) <= 1:
+            return [self.fetch(u) for u in urls]
+
+        with ThreadPoolExecutor(min(len(urls), MAX_FETCH_WORKERS)) as executor:
+            return list(executor.map(self.fetch, urls))
@@ -5,10 +5,17 @@
 
 import subprocess
 import sys
+from pathlib import Path
 
+import shacl2code
 from shacl2code import VERSION
+from shacl2code.cache import source_hash
 from shacl2code.lang import LANGUAGES
 
+THIS_DIR = Path(__file__).parent
+
+TEST_MODEL = THIS_DIR / "data" / "model" / "test.ttl"
+
 
 def test_shacl2code_exists():
     """
@@ -63,3 +70,192 @@ def test_version():
     )
 
     assert p.stdout.rstrip() == VERSION
+
+
+def test_generate_profile(tmp_path):
+    """
+    Tests that --profile reports the time of each generation stage
+    """
+    p = subprocess.run(
+        [
+            "shacl2code",
+            "generate",
+            "--input",
+            TEST_MODEL,
+            "--profile",
+            "jsonschema",
+            "--output",
+            tmp_path / "schema.json",
+        ],
+        check=True,
+        stderr=subprocess.PIPE,
+        encoding="utf-8",
+    )
+
+    stages = [line.split("-")[0].rstrip() for line in p.stderr.splitlines()]
+    assert stages == ["context", "parse", "model", "render"]
+
+
+def test_generate_cache(tmp_path):
+    """
+    Tests that --cache-dir reuses output for unchanged inputs, and regenerates
+    it when the input or template changes
+    """
+    model = tmp_path / "model.ttl"
+    model.write_bytes(TEST_MODEL.read_bytes())
+    template = tmp_path / "template.j2"
+    template.write_text("{% for class in classes %}{{ class.clsname }}\n{% endfor %}")
+    outfile = tmp_path / "out.txt"
+
+    def generate():
+        outfile.unlink(missing_ok=True)
+        p = subprocess.run(
+            [
+                "shacl2code",
+                "generate",
+                "--input",
+                model,
+                "--cache-dir",
+                tmp_path / "cache",
+                "--profile",
+                "jinja",
+                "--output",
+                outfile,
+                "--template",
+                template,
+            ],
+            check=True,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+        )
+        stages = [line.split("-")[0].rstrip() for line in p.stderr.splitlines()]
+        return stages, outfile.read_text()
+
+    stages, first = generate()
+    assert stages == ["context", "cache", "parse", "model", "render"]
+    assert first
+
+    stages, second = generate()
+    assert stages == ["context", "cache"]
+    assert second == first
+
+    template.write_text("{% for class in classes %}{{ class.clsname }}!\n{% endfor %}")
+    stages, third = generate()
+    assert stages == ["context", "cache", "parse", "model", "render"]
+    assert third == first.replace("\n", "!\n")
+
+    with model.open("a") as f:
+        f.write("\n<http://example.org/extra> a owl:Class, sh:NodeShape .\n")
+    stages, fourth = generate()
+    assert stages == ["context", "cache", "parse", "model", "render"]
+    assert fourth != third
+
+
+def test_source_hash(tmp_path):
+    """
+    Tests that the source hash used in the cache key changes when any Python
+    source file changes
+    """
+    src = tmp_path / "src"
+    (src / "lang").mkdir(parents=True)
+    (src / "main.py").write_text("main = 1\n")
+    (src / "lang" / "python.py").write_text("python = 1\n")
+    (src / "lang" / "template.j2").write_text("template\n")
+
+    first = source_hash(src)
+    assert source_hash(src) == first
+
+    # Templates are part of the key separately
+    (src / "lang" / "template.j2").write_text("changed\n")
+    assert source_hash(src) == first
+
+    (src / "lang" / "python.py").write_text("python = 2\n")
+    second = source_hash(src)
+    assert second != first
+
+    (src / "lang" / "python.py").rename(src / "lang" / "other.py")
+    assert source_hash(src) not in (first, second)
+
+    assert source_hash() == source_hash(Path(shacl2code.__file__).parent)
+
+
+def test_generate_cache_corrupt(tmp_path):
+    """
+    Tests that unreadable cache entries are treated as misses and replaced
+    """
+    outfile = tmp_path / "out.txt"
+    cache = tmp_path / "cache"
+
+    def generate():
+        p = subprocess.run(
+            [
+                "shacl2code",
+                "generate",
+                "--input",
+                TEST_MODEL,
+                "--cache-dir",
+                cache,
+                "--profile",
+                "jsonschema",
+                "--output",
+                outfile,
+            ],
+            check=True,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+        )
+        stages = [line.split("-")[0].rstrip() for line in p.stderr.splitlines()]
+        return stages, outfile.read_text()
+
+    stages, expect = generate()
+    assert stages == ["context", "cache", "parse", "model", "render"]
+
+    entries = sorted(cache.glob("*.pickle"))
+    assert len(entries) >= 2
+    for idx, e in enumerate(entries):
+        if idx % 2:
+            # Truncated entry
+            data = e.read_bytes()
+            e.write_bytes(data[: len(data) // 2])
+        else:
+            # Entry that refers to a class which does not exist (anymore)
+            e.write_bytes(b"cshacl2code.model\nMissingClass\n.")
+
+    stages, actual = generate()
+    assert stages == ["context", "cache", "parse", "model", "render"]
+    assert actual == expect
+
+    stages, actual = generate()
+    assert stages == ["context", "cache"]
+    assert actual == expect
+
+
+def test_generate_jobs(tmp_path):
+    """
+    Tests that rendering outputs in parallel generates the same files as
+    rendering them one at a time
+    """
+
+    def generate(name, jobs):
+        outdir = tmp_path / name
+        outdir.mkdir()
+        subprocess.run(
+            [
+                "shacl2code",
+                "generate",
+                "--input",
+                TEST_MODEL,
+                "--jobs",
+                str(jobs),
+                "golang",
+                "--output",
+                outdir,
+            ],
+            check=True,
+        )
+        return {p.name: p.read_text() for p in outdir.iterdir()}
+
+    serial = generate("serial", 1)
+    parallel = generate("parallel", 4)
+    assert len(serial) > 1
+    assert parallel == serial
@@ -3,6 +3,7 @@
 #
 # SPDX-License-Identifier: MIT
 
+import os
 import subprocess
 from pathlib import Path
 
@@ -11,6 +12,7 @@ THIS_DIR = Path(__file__).parent
 TEST_MODEL = THIS_DIR / "data" / "model" / "test.ttl"
 ABORT_TEMPLATE = THIS_DIR / "data" / "abort.j2"
 BAD_ID_TEMPLATE = THIS_DIR / "data" / "bad-id.j2"
+RAW_TEMPLATE = THIS_DIR / "data" / "raw.j2"
 
 
 def test_jinja_abort(tmp_path):
@@ -63,3 +65,44 @@ def test_bad_id_get(tmp_path):
 
     assert p.returncode != 0, "Process exited successfully when a failure was expected"
     assert "KeyError" in p.stderr
+
+
+def test_bytecode_cache(tmp_path):
+    """
+    Tests that compiled templates are stored in the --cache-dir directory and
+    used by later runs, and that nothing is cached without it
+    """
+    # Any cache that ignores --cache-dir would end up here
+    env = {**os.environ, "XDG_CACHE_HOME": str(tmp_path / "xdg"), "HOME": str(tmp_path)}
+
+    def generate(*args):
+        outfile = tmp_path / "out.txt"
+        subprocess.run(
+            [
+                "shacl2code",
+                "generate",
+                "--input",
+                TEST_MODEL,
+                *args,
+                "jinja",
+                "--output",
+                outfile,
+                "--template",
+                RAW_TEMPLATE,
+            ],
+            check=True,
+            env=env,
+        )
+        return outfile.read_text()
+
+    first = generate()
+    assert not (tmp_path / "xdg").exists()
+    assert not (tmp_path / ".cache").exists()
+
+    assert generate("--cache-dir", tmp_path / "cache") == first
+    cached = list((tmp_path / "cache" / "jinja").iterdir())
+    assert cached, "No compiled templates cached"
+
+    assert generate("--cache-dir", tmp_path / "cache") == first
+    assert list((tmp_path / "cache" / "jinja").iterdir()) == cached
+    assert not (tmp_path / "xdg").exists()
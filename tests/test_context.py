@@ -136,3 +136,23 @@ def test_expand_compact(extra_contexts, compact):
 
     test_context(extra_contexts, compact)
     test_context(BASE_CONTEXT + extra_contexts, compact)
+
+
+def test_large_context():
+    """
+    Tests compaction and expansion with a context that has many terms
+    """
+    terms = {"prefix": "http://example.com/terms/"}
+    for i in range(5000):
+        terms[f"Term{i}"] = f"prefix:Term{i}"
+    terms["longAlias"] = "prefix:Term42"
+
+    ctx = Context([terms])
+    for i in range(5000):
+        iri = f"http://example.com/terms/Term{i}"
+        assert ctx.expand_iri(f"Term{i}") == iri
+        assert ctx.compact_iri(iri) == f"Term{i}"
+
+    assert ctx.expand_iri("longAlias") == "http://example.com/terms/Term42"
+    assert ctx.compact_iri("http://example.com/terms/Other") == "prefix:Other"
+    assert ctx.compact_iri("http://example.org/other") == "http://example.org/other"
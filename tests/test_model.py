@@ -30,3 +30,146 @@ def test_model_ontology(model):
         assert c.ontology is model.ontologies[0]
         for i in c.named_individuals:
             assert i.ontology is model.ontologies[0]
+
+
+def test_graph_index():
+    g = rdflib.Graph()
+    g.parse(THIS_DIR / "data" / "model" / "test.ttl")
+    index = shacl2code.model.GraphIndex(g)
+
+    for s, p, o in g:
+        assert (s, p, o) in index
+        assert set(index.objects(s, p)) == set(g.objects(s, p))
+        assert set(index.subjects(p, o)) == set(g.subjects(p, o))
+        assert index.value(s, p) in set(g.objects(s, p))
+
+    assert (
+        rdflib.URIRef("http://example.com/missing"),
+        rdflib.RDF.type,
+        rdflib.OWL.Class,
+    ) not in index
+    assert index.value(rdflib.URIRef("http://example.com/missing"), "x", 1) == 1
+
+
+def test_inherited_values():
+    g = rdflib.Graph()
+    g.parse(
+        data="""
+        @prefix owl: <http://www.w3.org/2002/07/owl#> .
+        @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+        @prefix sh: <http://www.w3.org/ns/shacl#> .
+        @prefix sh-to-code: <https://jpewdev.github.io/shacl2code/schema#> .
+        @prefix ex: <http://example.com/> .
+
+        ex:root a owl:Class ;
+            sh-to-code:idPropertyName "rootid" .
+
+        ex:left a owl:Class ;
+            rdfs:subClassOf ex:root ;
+            sh:nodeKind sh:IRI .
+
+        ex:right a owl:Class ;
+            rdfs:subClassOf ex:root .
+
+        ex:diamond a owl:Class ;
+            rdfs:subClassOf ex:left, ex:right .
+
+        ex:leaf a owl:Class ;
+            rdfs:subClassOf ex:diamond ;
+            sh-to-code:idPropertyName "leafid" .
+        """,
+        format="turtle",
+    )
+    m = shacl2code.model.Model(g)
+    classes = {c._id: c for c in m.classes}
+
+    def check(name, id_property, node_kind):
+        c = classes[f"http://example.com/{name}"]
+        assert c.id_property == id_property
+        assert c.node_kind == node_kind
+
+    check("root", "rootid", rdflib.SH.BlankNodeOrIRI)
+    check("left", "rootid", rdflib.SH.IRI)
+    check("right", "rootid", rdflib.SH.BlankNodeOrIRI)
+    check("diamond", "rootid", rdflib.SH.IRI)
+    check("leaf", "leafid", rdflib.SH.IRI)
+
+
+def test_class_order():
+    g = rdflib.Graph()
+    g.parse(
+        data="""
+        @prefix owl: <http://www.w3.org/2002/07/owl#> .
+        @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+        @prefix ex: <http://example.com/> .
+
+        ex:a a owl:Class ;
+            rdfs:subClassOf ex:c .
+        ex:b a owl:Class .
+        ex:c a owl:Class .
+        ex:d a owl:Class ;
+            rdfs:subClassOf ex:a, ex:b .
+        """,
+        format="turtle",
+    )
+    m = shacl2code.model.Model(g)
+    assert [c._id for c in m.classes] == [
+        "http://example.com/b",
+        "http://example.com/c",
+        "http://example.com/a",
+        "http://example.com/d",
+    ]
+
+
+def test_class_cycle():
+    g = rdflib.Graph()
+    g.parse(
+        data="""
+        @prefix owl: <http://www.w3.org/2002/07/owl#> .
+        @prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+        @prefix ex: <http://example.com/> .
+
+        ex:a a owl:Class ;
+            rdfs:subClassOf ex:b .
+        ex:b a owl:Class ;
+            rdfs:subClassOf ex:a .
+        ex:c a owl:Class .
+        """,
+        format="turtle",
+    )
+    with pytest.raises(shacl2code.model.ModelException, match="cycle"):
+        shacl2code.model.Model(g)
+
+
+def test_named_individuals():
+    g = rdflib.Graph()
+    g.parse(
+        data="""
+        @prefix owl: <http://www.w3.org/2002/07/owl#> .
+        @prefix ex: <http://example.com/> .
+
+        ex:a a owl:Class .
+        ex:b a owl:Class .
+        ex:c a owl:Class .
+
+        <http://example.com/a/two> a owl:NamedIndividual, ex:a .
+        <http://example.com/a/one> a owl:NamedIndividual, ex:a, ex:b .
+        <http://example.com/a/not-named> a ex:a .
+        """,
+        format="turtle",
+    )
+    m = shacl2code.model.Model(g)
+    classes = {c._id: c for c in m.classes}
+
+    assert [i._id for i in classes["http://example.com/a"].named_individuals] == [
+        "http://example.com/a/one",
+        "http://example.com/a/two",
+    ]
+    assert [i.varname for i in classes["http://example.com/a"].named_individuals] == [
+        "one",
+        "two",
+    ]
+    assert [i._id for i in classes["http://example.com/b"].named_individuals] == [
+        "http://example.com/a/one",
+    ]
+    assert classes["http://example.com/c"].named_individuals == []
@@ -4,6 +4,7 @@
 # SPDX-License-Identifier: MIT
 
 import json
+import os
 import shutil
 import subprocess
 from pathlib import Path
@@ -356,6 +357,66 @@ def test_context_args(http_server):
     )
 
 
+def test_context_cache(http_server, tmp_path):
+    """
+    Tests that remote contexts are stored in the cache, revalidated when
+    online, and used from the cache when offline
+    """
+    context = http_server.document_root / "context.json"
+    shutil.copyfile(TEST_CONTEXT, context)
+    url = f"{http_server.uri}/context.json"
+
+    def generate(*args):
+        return subprocess.run(
+            [
+                "shacl2code",
+                "generate",
+                "--input",
+                TEST_MODEL,
+                "--context",
+                url,
+                "--cache-dir",
+                tmp_path / "cache",
+                *args,
+                "jinja",
+                "--output",
+                "-",
+                "--template",
+                CONTEXT_TEMPLATE,
+            ],
+            stdout=subprocess.PIPE,
+            encoding="utf-8",
+        )
+
+    p = generate("--offline")
+    assert p.returncode != 0, "Uncached context was found offline"
+
+    p = generate()
+    assert p.returncode == 0
+    compacted = p.stdout
+
+    # Changing the context on the server must be noticed when revalidating
+    context.write_text(json.dumps({"@context": {}}))
+    st = context.stat()
+    os.utime(context, (st.st_atime + 10, st.st_mtime + 10))
+
+    p = generate()
+    assert p.returncode == 0
+    assert p.stdout != compacted
+    expanded = p.stdout
+
+    # Unchanged context is reused after revalidating it
+    p = generate()
+    assert p.returncode == 0
+    assert p.stdout == expanded
+
+    http_server.stop()
+
+    p = generate("--offline")
+    assert p.returncode == 0
+    assert p.stdout == expanded
+
+
 @pytest.mark.parametrize(
     "file",
     [
@@ -5,6 +5,7 @@
 
 import hashlib
 import importlib
+import io
 import json
 import os
 import re
@@ -380,6 +381,236 @@ def test_roundtrip(model, tmp_path, roundtrip):
     check_file(outfile, expect_data, digest)
 
 
+@pytest.mark.parametrize(
+    "args",
+    [
+        {},
+        {"indent": 2},
+        {"indent": 4},
+        {"indent": 2, "sort_keys": True},
+        {"separators": (",", ":")},
+        {"separators": (",", ":"), "ensure_ascii": False},
+        {"indent": 2, "ensure_ascii": False, "sort_keys": True},
+    ],
+)
+def test_serializer_backend(model, roundtrip, args):
+    pytest.importorskip("orjson")
+
+    doc = model.SHACLObjectSet()
+    with roundtrip.open("r") as f:
+        model.JSONLDDeserializer().read(f, doc)
+
+    # DEL is the only ASCII character that json escapes and orjson does not
+    doc.add(
+        model.test_class(
+            _id="http://example.org/del", test_class_string_scalar_prop="a\x7fb"
+        )
+    )
+
+    expect = io.BytesIO()
+    expect_digest = model.JSONLDSerializer(backend="json", **args).write(doc, expect)
+
+    out = io.BytesIO()
+    digest = model.JSONLDSerializer(backend="orjson", **args).write(doc, out)
+
+    assert out.getvalue() == expect.getvalue()
+    assert digest == expect_digest
+    assert digest == hashlib.sha1(out.getvalue()).hexdigest()
+    assert json.loads(out.getvalue()) == model.JSONLDSerializer().serialize_data(doc)
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        {},
+        {"indent": 2},
+        {"separators": (",", ":"), "sort_keys": True},
+    ],
+)
+def test_serializer_orjson_used(model, roundtrip, monkeypatch, args):
+    pytest.importorskip("orjson")
+
+    doc = model.SHACLObjectSet()
+    with roundtrip.open("r") as f:
+        model.JSONLDDeserializer().read(f, doc)
+
+    expect = io.BytesIO()
+    model.JSONLDSerializer(backend="json", **args).write(doc, expect)
+
+    # orjson produces the same output for these arguments, including the
+    # default separators, so json is not used
+    def no_json(data, args):
+        raise AssertionError("json used instead of orjson")
+
+    module = sys.modules[model.JSONLDSerializer.__module__]
+    monkeypatch.setattr(module, "dump_json", no_json)
+
+    out = io.BytesIO()
+    model.JSONLDSerializer(**args).write(doc, out)
+    assert out.getvalue() == expect.getvalue()
+
+
+def test_serializer_json_chunks(model, roundtrip):
+    doc = model.SHACLObjectSet()
+    with roundtrip.open("r") as f:
+        model.JSONLDDeserializer().read(f, doc)
+
+    # The json backend writes the output as it is encoded
+    class Writes(io.BytesIO):
+        count = 0
+
+        def write(self, b):
+            self.count += 1
+            return super().write(b)
+
+    out = Writes()
+    digest = model.JSONLDSerializer(backend="json").write(doc, out)
+    assert out.count > 1
+    assert digest == hashlib.sha1(out.getvalue()).hexdigest()
+
+
+def test_serializer_bad_backend(model):
+    with pytest.raises(ValueError):
+        model.JSONLDSerializer(backend="foo")
+
+
+def test_inline_serializer_blocks(model, roundtrip, monkeypatch):
+    doc = model.SHACLObjectSet()
+    with roundtrip.open("r") as f:
+        model.JSONLDDeserializer().read(f, doc)
+
+    expect = io.BytesIO()
+    expect_digest = model.JSONLDInlineSerializer().write(doc, expect)
+
+    # Force the output to be flushed in many small blocks
+    monkeypatch.setattr(model.JSONLDInlineEncoder, "BLOCK_PARTS", 1)
+
+    out = io.BytesIO()
+    digest = model.JSONLDInlineSerializer().write(doc, out)
+
+    assert out.getvalue() == expect.getvalue()
+    assert digest == expect_digest
+    assert digest == hashlib.sha1(out.getvalue()).hexdigest()
+
+
+@pytest.mark.parametrize("backend", ["json", "ijson"])
+@pytest.mark.parametrize("context_last", [False, True])
+@pytest.mark.parametrize("chunk_size", [1, 7])
+def test_stream_read(
+    model, tmp_path, roundtrip, monkeypatch, backend, context_last, chunk_size
+):
+    if backend == "ijson":
+        pytest.importorskip("ijson")
+
+    # Force the document to be read in many small chunks
+    monkeypatch.setattr(model.JSONStream, "CHUNK_SIZE", chunk_size)
+
+    with roundtrip.open("r") as f:
+        data = json.load(f)
+
+    if context_last:
+        data["@context"] = data.pop("@context")
+
+    infile = tmp_path / "in.json"
+    with infile.open("w") as f:
+        json.dump(data, f, indent=2)
+
+    expect = model.SHACLObjectSet()
+    model.JSONLDDeserializer().deserialize_data(data, expect)
+
+    doc = model.SHACLObjectSet()
+    with infile.open("rb") as f:
+        model.JSONLDDeserializer(backend=backend).read(f, doc)
+
+    s = model.JSONLDSerializer()
+    assert s.serialize_data(doc) == s.serialize_data(expect)
+    assert doc.context == expect.context
+
+
+def test_stream_chunks(model, monkeypatch):
+    """
+    Tests that values split across chunks are parsed correctly, however the
+    document is split
+    """
+    data = textwrap.dedent(r"""
+        {"a": 1.25, "b": [-3e5, 10, 1E+2, 0.5e-3, -0, 123456789, 7.0],
+        "@graph": [{"s": "x\"y\u00e9\ud83d\ude00\n\\\/", "t": true, "n": null,
+        "f": false, "u": "é😀"}, 7.5, "z", [], {}],
+        "c": {"d": [1.0, "\\"]}, "e": 42}
+        """).encode("utf-8")
+    doc = json.loads(data)
+    expect = [(k, v) for k, v in doc.items() if k != "@graph"]
+    expect.insert(2, ("@graph", model.JSONStream.GRAPH_START))
+    for item in reversed(doc["@graph"]):
+        expect.insert(3, ("@graph", item))
+
+    for size in range(1, 10):
+        monkeypatch.setattr(model.JSONStream, "CHUNK_SIZE", size)
+        assert list(model.JSONStream(io.BytesIO(data))) == expect, size
+
+
+@pytest.mark.parametrize("backend", ["json", "ijson"])
+@pytest.mark.parametrize("context_last", [False, True])
+def test_stream_read_empty_graph(model, backend, context_last):
+    if backend == "ijson":
+        pytest.importorskip("ijson")
+
+    data = {
+        "@context": {"foo": "http://foo.example.com/"},
+        "@graph": [],
+    }
+    if context_last:
+        data["@context"] = data.pop("@context")
+    text = json.dumps(data).encode("utf-8")
+
+    deserializer = model.JSONLDDeserializer(backend=backend)
+    doc = model.SHACLObjectSet()
+    deserializer.read(io.BytesIO(text), doc)
+    assert doc.objects == set()
+    assert doc.context == data["@context"]
+
+    assert list(deserializer.iter_objects(io.BytesIO(text))) == []
+
+
+def test_stream_read_bad_backend(model):
+    with pytest.raises(ValueError):
+        model.JSONLDDeserializer(backend="foo")
+
+
+def test_iter_objects(model, roundtrip):
+    with roundtrip.open("r") as f:
+        data = json.load(f)
+
+    expect = model.SHACLObjectSet()
+    model.JSONLDDeserializer().deserialize_data(data, expect)
+
+    with roundtrip.open("rb") as f:
+        objs = list(model.JSONLDDeserializer().iter_objects(f))
+
+    assert len(objs) == len(data["@graph"])
+    assert sorted(o._id for o in objs if o._id) == sorted(
+        o._id for o in expect.objects if o._id
+    )
+
+    # References are not linked
+    refs = 0
+    for o in objs:
+        if not o._id:
+            continue
+        e = expect.find_by_id(o._id)
+        assert type(o) is type(e)
+        for iri in e:
+            if isinstance(e[iri], model.SHACLObject) and e[iri]._id:
+                assert o[iri] == e[iri]._id
+                refs += 1
+    assert refs
+
+    # Iteration can stop early
+    with roundtrip.open("rb") as f:
+        it = model.JSONLDDeserializer().iter_objects(f)
+        assert next(it)._id == objs[0]._id
+
+
 def test_script_roundtrip(model_script, tmp_path, roundtrip):
     outpath = tmp_path / "out.json"
 
@@ -520,6 +751,85 @@ def test_deserialize(model, filename, expect):
             deserializer.read(f, objset)
 
 
+@pytest.mark.parametrize(
+    "filename,expect",
+    [
+        ("bad-object-type-inline.json", TypeError),
+        ("bad-object-type-ref-before.json", TypeError),
+        ("bad-object-type-ref-after.json", TypeError),
+    ],
+)
+def test_deserialize_no_validate(model, filename, expect):
+    objset = model.SHACLObjectSet()
+    deserializer = model.JSONLDDeserializer(validate=False)
+    with (DATA_DIR / "python" / filename).open("r") as f:
+        deserializer.read(f, objset)
+
+    with pytest.raises(expect):
+        objset.validate()
+
+
+def test_deserialize_key_context(model):
+    """
+    Tests that the property a key refers to is looked up using the context
+    of each document, even if the same deserializer and class are used
+    """
+    deserializer = model.JSONLDDeserializer()
+
+    def read(prefix, value):
+        data = {
+            "@context": {
+                "p": "http://example.org/shacl2code-test/test-class/" + prefix
+            },
+            "@type": "http://example.org/shacl2code-test/test-class",
+            "@id": "http://example.org/test",
+            "p:prop": value,
+        }
+        objset = model.SHACLObjectSet()
+        deserializer.read(io.BytesIO(json.dumps(data).encode("utf-8")), objset)
+        return objset.find_by_id("http://example.org/test")
+
+    c = read("string-scalar-", "foo")
+    assert c.test_class_string_scalar_prop == "foo"
+    assert c.test_class_string_list_prop == []
+
+    c = read("string-list-", ["foo"])
+    assert c.test_class_string_scalar_prop is None
+    assert c.test_class_string_list_prop == ["foo"]
+
+    with pytest.raises(KeyError):
+        read("unknown-", "foo")
+
+
+def test_validate_objset(model, roundtrip):
+    with roundtrip.open("rb") as f:
+        expect = model.SHACLObjectSet()
+        model.JSONLDDeserializer().read(f, expect)
+
+    with roundtrip.open("rb") as f:
+        objset = model.SHACLObjectSet()
+        model.JSONLDDeserializer(validate=False).read(f, objset)
+
+    objset.validate()
+
+    s = model.JSONLDSerializer()
+    assert s.serialize_data(objset) == s.serialize_data(expect)
+
+    # Invalid values are only detected by validate()
+    data = {
+        "@type": "http://example.org/shacl2code-test/test-class",
+        "@id": "http://example.com/bad",
+        "http://example.org/shacl2code-test/test-class/regex": "bar",
+    }
+    with pytest.raises(ValueError):
+        model.JSONLDDeserializer().deserialize_data(data, model.SHACLObjectSet())
+
+    objset = model.SHACLObjectSet()
+    model.JSONLDDeserializer(validate=False).deserialize_data(data, objset)
+    with pytest.raises(ValueError):
+        objset.validate()
+
+
 def test_node_kind_blank(model, test_context_url):
     s = model.JSONLDSerializer()
     c1 = model.link_class()
@@ -1092,6 +1402,121 @@ def test_derived_property(model):
     assert c.test_derived_class_string_prop == "def"
 
 
+def test_lazy_list_property(model):
+    c = model.test_class()
+    c.test_class_string_scalar_prop = "abc"
+
+    # Serializing does not need to create list properties that were never used
+    model.JSONLDSerializer().serialize_data(model.SHACLObjectSet([c]))
+    with pytest.raises(AttributeError):
+        object.__getattribute__(c, "test_class_string_list_prop")
+
+    # The list is created when first read, and changes to it are kept
+    assert c.test_class_string_list_prop == []
+    c.test_class_string_list_prop.append("foo")
+    assert c.test_class_string_list_prop == ["foo"]
+
+    del c.test_class_string_list_prop
+    assert c.test_class_string_list_prop == []
+
+    del c.test_class_string_scalar_prop
+    assert c.test_class_string_scalar_prop is None
+
+
+def test_walk(model):
+    LIST_PROP = ".http://example.org/shacl2code-test/link-class-link-list-prop"
+    LINK_PROP = ".http://example.org/shacl2code-test/link-class-link-prop"
+
+    c = model.link_class(_id="http://example.org/c")
+    b = model.link_class()
+    b.link_class_link_prop = c
+    a = model.link_class(_id="http://example.org/a")
+    a.link_class_link_list_prop = [b, "http://example.org/missing"]
+
+    def objects(walk):
+        result = []
+
+        def callback(value, path):
+            if not isinstance(path, list):
+                path = model.walk_path_list(path)
+            if isinstance(value, (model.SHACLObject, str)):
+                result.append((value, path))
+            return True
+
+        walk(callback)
+        return result
+
+    expect = [
+        (a, ["."]),
+        (b, [".", LIST_PROP, "[0]"]),
+        (c, [".", LIST_PROP, "[0]", LINK_PROP]),
+        ("http://example.org/c", [".", LIST_PROP, "[0]", LINK_PROP, ".@id"]),
+        ("http://example.org/missing", [".", LIST_PROP, "[1]"]),
+        ("http://example.org/a", [".", ".@id"]),
+    ]
+    assert objects(a.walk) == expect
+    assert objects(a.visit) == expect
+
+
+def test_walk_deep(model):
+    # Deeper than the Python recursion limit
+    depth = sys.getrecursionlimit() * 2
+
+    root = model.link_class()
+    o = root
+    for _ in range(depth):
+        child = model.link_class()
+        o.link_class_link_prop = child
+        o = child
+
+    count = 0
+
+    def callback(value, path):
+        nonlocal count
+        if isinstance(value, model.SHACLObject):
+            count += 1
+        return True
+
+    root.visit(callback)
+    assert count == depth + 1
+
+    assert len(list(root.iter_objects(recursive=True))) == depth
+    assert len(list(model.SHACLObjectSet([root]).foreach())) == depth + 1
+
+
+def test_lazy_list_property_serialize(model):
+    """
+    Tests that list properties serialize the same whether they were created
+    by reading them, by assigning them, or not at all
+    """
+
+    def make():
+        c = model.test_class(_id="http://example.org/lazy")
+        c.test_class_string_scalar_prop = "abc"
+        return c
+
+    def serialize(c):
+        f = io.BytesIO()
+        model.JSONLDSerializer().write(model.SHACLObjectSet([c]), f)
+        return f.getvalue()
+
+    unused = make()
+    read = make()
+    assert read.test_class_string_list_prop == []
+    # Reading the property stored the empty list on the object
+    assert object.__getattribute__(read, "test_class_string_list_prop") == []
+    assert serialize(read) == serialize(unused)
+
+    appended = make()
+    appended.test_class_string_list_prop.append("foo")
+    appended.test_class_class_list_prop.append("http://example.org/other")
+    assigned = make()
+    assigned.test_class_string_list_prop = ["foo"]
+    assigned.test_class_class_list_prop = ["http://example.org/other"]
+    assert serialize(appended) == serialize(assigned)
+    assert serialize(appended) != serialize(unused)
+
+
 def list_type_tests(name, *typ):
     tests = [
         # Non list types
@@ -1834,6 +2259,92 @@ def test_objset_foreach_type(model, roundtrip):
     assert set(objset.foreach_type(model.abstract_class, match_subclass=True)) == expect
 
 
+def test_objset_count_refs(model):
+    """
+    Tests that references are counted the same as walking every object did,
+    and that blank nodes are inlined or given IDs based on those counts
+    """
+
+    def make(_id=None, *links):
+        o = model.link_class(_id=_id) if _id else model.link_class()
+        o.link_class_link_list_prop.extend(links)
+        return o
+
+    def walk_counts(objset):
+        counts = {}
+
+        def callback(value, path):
+            if not isinstance(value, model.SHACLObject):
+                return True
+            counts[value] = counts.get(value, 0) + 1
+            return counts[value] == 1
+
+        for o in objset.objects:
+            o.walk(callback)
+        return counts
+
+    shared = make()
+    cycle_a = make()
+    cycle_b = make(None, cycle_a)
+    cycle_a.link_class_link_list_prop.append(cycle_b)
+    selfref = make()
+    selfref.link_class_link_list_prop.append(selfref)
+    once = make()
+    twice = make()
+    iri = make("http://example.org/iri", shared)
+    root1 = make("http://example.org/root1", shared, cycle_a, once, twice, twice, iri)
+    root2 = make(None, selfref, iri)
+
+    objset = model.SHACLObjectSet([root1, root2, cycle_a])
+    counts = objset._count_refs()
+    assert counts == walk_counts(objset)
+    assert counts == {
+        root1: 1,
+        root2: 1,
+        iri: 2,
+        shared: 2,
+        cycle_a: 3,
+        cycle_b: 1,
+        selfref: 2,
+        once: 1,
+        twice: 2,
+    }
+
+    # Objects with an IRI and objects that are referenced more than once are
+    # referenced by ID, the others are written inline
+    state = model.EncodeState(objset)
+    objset._plan_encode(state)
+    assert state.ref_objects == {o for o, c in counts.items() if o._id or c > 1}
+
+    # Blank nodes that are referenced more than once get an ID, the others
+    # are written inline
+    data = model.JSONLDSerializer().serialize_data(objset)
+    blank_ids = {o["@id"] for o in data["@graph"] if o.get("@id", "").startswith("_:")}
+    assert len(blank_ids) == len([o for o, c in counts.items() if not o._id and c > 1])
+    root1_data = [o for o in data["@graph"] if o.get("@id") == root1._id][0]
+    assert root1_data["link-class-link-list-prop"][2] == {"@type": "link-class"}
+
+    # Blank nodes in the root set that are referenced once more are inlined
+    objset = model.SHACLObjectSet([root1, root2, cycle_a, shared, once, twice])
+    counts = objset._count_refs()
+    assert counts == walk_counts(objset)
+    objset.inline_blank_nodes()
+    assert objset.objects == {root1, root2, cycle_a, shared, twice}
+
+    # Blank node IDs are removed for re-assignment, but objects in the set
+    # that had one are still referenced by ID
+    blank = make("_:blank")
+    inline = make("_:inline")
+    root1.link_class_link_list_prop.append(inline)
+    objset = model.SHACLObjectSet([root1, blank])
+    state = model.EncodeState(objset)
+    objset._plan_encode(state)
+    assert blank._id is None
+    assert inline._id is None
+    assert blank in state.ref_objects
+    assert inline not in state.ref_objects
+
+
 def test_objset_remove(model):
     """
     Tests that removing an object from the object set works correctly
@@ -1851,6 +2362,137 @@ def test_objset_remove(model):
     assert obj2 in objset
 
 
+def test_objset_remove_index(model):
+    """
+    Tests that the index is correctly updated when objects are removed
+    """
+
+    def make(name, *links):
+        o = model.link_class(_id=f"https://example.org/{name}")
+        o.link_class_link_list_prop.extend(links)
+        return o
+
+    shared = make("shared")
+    cycle_a = make("cycle-a")
+    cycle_b = make("cycle-b", cycle_a)
+    cycle_a.link_class_link_list_prop.append(cycle_b)
+    child1 = make("child1", shared)
+    child2 = make("child2", shared, cycle_a)
+    root1 = make("root1", child1)
+    root2 = make("root2", child2, root1)
+    root3 = make("root3", shared)
+    # Different object with the same IRI as an indexed object
+    dup = model.link_class(_id="https://example.org/child2")
+
+    objset = model.SHACLObjectSet([root1, root2, root3, dup])
+
+    def check():
+        expect = model.SHACLObjectSet(objset.objects)
+        assert objset.obj_by_type == expect.obj_by_type
+        # Which object is found for a duplicated ID depends on the order the
+        # objects are walked
+        assert objset.obj_by_id.keys() == expect.obj_by_id.keys()
+        reachable = set(expect.foreach())
+        for _id, o in objset.obj_by_id.items():
+            assert o._id == _id
+            assert o in reachable
+
+    for o in (root3, root2, dup, root1):
+        objset.remove(o)
+        check()
+
+    assert objset.obj_by_id == {}
+    assert objset.obj_by_type == {}
+
+
+@pytest.mark.parametrize("linked", [False, True])
+def test_objset_add_remove_index(model, monkeypatch, linked):
+    """
+    Tests that adding objects between removals keeps the index up to date
+    without creating the reference counts again
+    """
+    created = []
+    create_ref_index = model.SHACLObjectSet._create_ref_index
+
+    def count_create(self):
+        created.append(self)
+        create_ref_index(self)
+
+    monkeypatch.setattr(model.SHACLObjectSet, "_create_ref_index", count_create)
+
+    def make(name, *links):
+        o = model.link_class(_id=f"https://example.org/{name}")
+        o.link_class_link_list_prop.extend(links)
+        return o
+
+    shared = make("shared")
+    objset = model.SHACLObjectSet([make("a", shared), make("b")], link=linked)
+
+    def check():
+        expect = model.SHACLObjectSet(objset.objects)
+        assert objset.obj_by_type == expect.obj_by_type
+        assert objset.obj_by_id == expect.obj_by_id
+
+    # The first removal creates the reference counts
+    objset.remove(objset.find_by_id("https://example.org/b"))
+    check()
+
+    c = objset.add(make("c", shared, make("c-child")))
+    d = objset.add(make("d", c))
+    # Dangling reference that is resolved by a later add() if the object
+    # set is linked
+    e = objset.add(make("e", "https://example.org/f"))
+    f = objset.add(make("f", make("f-child")))
+    check()
+
+    for o in (objset.find_by_id("https://example.org/a"), c, f, d, e):
+        objset.remove(o)
+        check()
+
+    assert objset.obj_by_id == {}
+    assert objset.obj_by_type == {}
+    assert created == [objset]
+
+
+@pytest.mark.parametrize("linked", [False, True])
+def test_objset_add_remove_duplicate_ids(model, linked):
+    """
+    Tests that removing objects after adding objects with the same IDs as
+    indexed objects leaves the same index as creating it again
+    """
+
+    def make(tag, _id=None, *links):
+        o = model.link_class(link_class_tag=tag)
+        if _id:
+            o._id = _id
+        o.link_class_link_list_prop.extend(links)
+        return o
+
+    def check():
+        expect = model.SHACLObjectSet(objset.objects)
+        assert objset.obj_by_type == expect.obj_by_type
+        assert objset.obj_by_id.keys() == expect.obj_by_id.keys()
+        assert set(objset.obj_by_id.values()) <= set(expect.foreach())
+
+    a = make("a", "https://example.org/dup", make("a-child"))
+    b = make("b", None, a)
+    objset = model.SHACLObjectSet([a, b], link=linked)
+    objset.remove(a)
+    check()
+
+    # References to the duplicate are replaced by a if the object set is
+    # linked, and the child of the duplicate is no longer reachable
+    c = objset.add(
+        make("c", None, make("dup", "https://example.org/dup", make("dup-child")))
+    )
+    objset.add(make("d", "https://example.org/dup", make("d-child")))
+    check()
+
+    for o in (c, b):
+        objset.remove(o)
+        check()
+
+
 def test_objset_remove_not_existing(model):
     """
     Tests that removing an object that is not in the object set does not
@@ -1918,6 +2560,37 @@ def test_required_abstract_class_property(model, tmp_path):
     assert c.required_abstract_abstract_class_prop is None
 
 
+def test_ancestor_types(model):
+    """
+    Tests that the precomputed ancestor types of each class match the
+    registered classes it is an instance of
+    """
+
+    class Extension(model.extensible_class):
+        TYPE = "http://example.org/shacl2code-test/ancestor-extension-class"
+
+    class DerivedExtension(Extension):
+        TYPE = "http://example.org/shacl2code-test/derived-extension-class"
+
+    registered = {c for c in model.SHACLObject.CLASSES.values() if c._is_registered()}
+    assert model.extensible_class in registered
+
+    for cls in registered | {Extension, DerivedExtension}:
+        expect = {
+            (c._TYPE, c._COMPACT_TYPE)
+            for c in registered
+            if c is not cls and issubclass(cls, c)
+        }
+        assert set(cls._ANCESTOR_TYPES) == expect, cls.__name__
+
+    objs = [Extension(), DerivedExtension(), model.extensible_class()]
+    objset = model.SHACLObjectSet(objs)
+    for c in registered:
+        assert set(objset.foreach_type(c)) == {
+            o for o in objs if isinstance(o, c)
+        }, c.__name__
+
+
 def test_extensible_abstract_class(model):
     class Extension(model.extensible_abstract_class):
         TYPE = "http://example.org/shacl2code-test/custom-extension-class"
@@ -1957,6 +2630,221 @@ def test_missing_ids(model, roundtrip):
     }
 
 
+def test_link_add(model):
+    a = model.link_class(_id="http://example.org/a")
+    a.link_class_link_prop = "http://example.org/b"
+    objset = model.SHACLObjectSet([a], link=True)
+    assert objset.missing_ids == {"http://example.org/b"}
+    assert a.link_class_link_prop == "http://example.org/b"
+
+    # Adding to a linked object set links the new objects, and resolves the
+    # references to them
+    b = model.link_class(_id="http://example.org/b")
+    c = model.link_class(_id="http://example.org/c")
+    b.link_class_link_list_prop = [c, "http://example.org/a"]
+    c.link_class_link_prop = "http://example.org/d"
+    objset.add(b)
+
+    assert a.link_class_link_prop is b
+    assert b.link_class_link_list_prop[1] is a
+    assert objset.find_by_id("http://example.org/c") is c
+    assert objset.missing_ids == {"http://example.org/d"}
+
+    d = model.link_class(_id="http://example.org/d")
+    objset.update([d])
+    assert c.link_class_link_prop is d
+    assert objset.missing_ids == set()
+
+
+def test_link_add_removed(model):
+    a = model.link_class(_id="http://example.org/a")
+    b = model.link_class(_id="http://example.org/b")
+    objset = model.SHACLObjectSet([a, b], link=True)
+
+    # Removing an object unlinks it, so it is indexed again when an object
+    # that references it is added
+    objset.remove(a)
+    assert objset.find_by_id("http://example.org/a") is None
+
+    c = model.link_class(_id="http://example.org/c", link_class_link_prop=a)
+    objset.add(c)
+    assert objset.find_by_id("http://example.org/a") is a
+    assert objset.find_by_id("http://example.org/c") is c
+
+
+def test_add_not_linked(model):
+    a = model.link_class(_id="http://example.org/a")
+    a.link_class_link_prop = "http://example.org/b"
+    objset = model.SHACLObjectSet([a])
+
+    objset.add(model.link_class(_id="http://example.org/b"))
+    assert a.link_class_link_prop == "http://example.org/b"
+
+    objset.link()
+    assert a.link_class_link_prop is objset.find_by_id("http://example.org/b")
+
+
+def test_link_add_blank(model):
+    a = model.link_class(_id="http://example.org/a")
+    a.link_class_link_prop = "_:b"
+    objset = model.SHACLObjectSet([a], link=True)
+    assert objset.missing_ids == {"_:b"}
+
+    # Blank node IDs are local to the objects they were linked with, so an
+    # unrelated new object with the same blank node ID is not linked
+    b = objset.add(model.link_class(_id="_:b"))
+    assert a.link_class_link_prop == "_:b"
+    assert b._id is None
+
+    c = model.link_class(_id="http://example.org/c")
+    c.link_class_link_prop = "_:d"
+    d = model.link_class(_id="_:d")
+    objset.add(model.link_class(link_class_link_list_prop=[c, d]))
+    assert c.link_class_link_prop is d
+
+
+def test_merge(model):
+    a = model.link_class(_id="http://example.org/a")
+    a.link_class_link_prop = "http://example.org/b"
+    objset1 = model.SHACLObjectSet([a], link=True)
+
+    b = model.link_class(_id="http://example.org/b")
+    # Duplicate of a, which is replaced by a when merged
+    b.link_class_link_prop = model.link_class(_id="http://example.org/a")
+    b.link_class_link_list_prop = ["http://example.org/a", "http://example.org/c"]
+    objset2 = model.SHACLObjectSet([b], link=True)
+
+    merged = objset1.merge(objset2)
+    assert merged.objects == {a, b}
+    assert a.link_class_link_prop is b
+    assert b.link_class_link_prop is a
+    assert b.link_class_link_list_prop == [a, "http://example.org/c"]
+    assert merged.missing_ids == {"http://example.org/c"}
+    assert merged.obj_by_id == {"http://example.org/a": a, "http://example.org/b": b}
+
+    # The objects are shared, so a is linked to b in objset1 too, but the
+    # index and missing IDs of objset1 are not changed
+    assert objset1.objects == {a}
+    assert objset1.missing_ids == {"http://example.org/b"}
+    assert objset1.obj_by_id == {"http://example.org/a": a}
+
+
+@pytest.mark.parametrize("linked", [False, True])
+@pytest.mark.parametrize(
+    "conflict,expect",
+    [
+        ("first", 0),
+        ("last", 1),
+        (lambda a, b: b if b.link_class_tag == "keep" else a, 1),
+    ],
+)
+def test_merge_conflict(model, linked, conflict, expect):
+    dups = [model.link_class(_id="http://example.org/dup") for _ in range(2)]
+    dups[1].link_class_tag = "keep"
+
+    objsets = []
+    for i, dup in enumerate(dups):
+        o = model.link_class(_id=f"http://example.org/o{i}")
+        o.link_class_link_prop = dup
+        o.link_class_link_list_prop = ["http://example.org/dup"]
+        objsets.append(model.SHACLObjectSet([o, dup], link=linked))
+
+    merged = objsets[0].merge(objsets[1], conflict=conflict)
+
+    keep = dups[expect]
+    assert merged.find_by_id("http://example.org/dup") is keep
+    assert keep in merged.objects
+    assert dups[1 - expect] not in merged.objects
+    assert set(merged.foreach_type(model.link_class)) == merged.objects
+    for o in merged.objects:
+        if o is not keep:
+            assert o.link_class_link_prop is keep
+            assert o.link_class_link_list_prop == [keep]
+    assert merged.missing_ids == set()
+
+
+def test_merge_conflict_error(model):
+    objset1 = model.SHACLObjectSet([model.link_class(_id="http://example.org/dup")])
+    objset2 = model.SHACLObjectSet([model.link_class(_id="http://example.org/dup")])
+
+    with pytest.raises(ValueError):
+        objset1.merge(objset2, conflict="error")
+
+    with pytest.raises(ValueError):
+        objset1.merge(objset2, conflict=lambda a, b: model.link_class())
+
+    with pytest.raises(ValueError):
+        objset1.merge(objset2, conflict="foo")
+
+    # The same object in multiple object sets is not a conflict
+    objset3 = model.SHACLObjectSet(objset1.objects)
+    merged = objset1.merge(objset3, conflict="error")
+    assert merged.objects == objset1.objects
+
+
+@pytest.mark.parametrize("linked", [False, True])
+@pytest.mark.parametrize("conflict", ["first", "error"])
+def test_merge_blank_ids(model, linked, conflict):
+    objsets = []
+    roots = []
+    blanks = []
+    for i in range(2):
+        o = model.link_class(_id=f"http://example.org/o{i}")
+        o.link_class_link_prop = "_:a"
+        blank = model.link_class(_id="_:a", link_class_tag=f"blank{i}")
+        roots.append(o)
+        blanks.append(blank)
+        objsets.append(model.SHACLObjectSet([o, blank], link=linked and i == 0))
+
+    # Each object set has its own blank node with the same ID, which is not a
+    # conflict
+    merged = objsets[0].merge(objsets[1], conflict=conflict)
+    assert merged.objects == set(roots + blanks)
+    for o, blank in zip(roots, blanks):
+        assert o.link_class_link_prop is blank
+        assert blank._id is None
+    assert merged.missing_ids == set()
+    assert "_:a" not in merged.obj_by_id
+
+
+def test_merge_many(model):
+    objsets = []
+    for i in range(10):
+        o = model.link_class(_id=f"http://example.org/o{i}")
+        o.link_class_link_prop = f"http://example.org/o{(i + 1) % 10}"
+        objsets.append(model.SHACLObjectSet([o], link=True))
+
+    merged = model.SHACLObjectSet().merge(*objsets)
+    assert len(merged.objects) == 10
+    assert merged.missing_ids == set()
+    for o in merged.objects:
+        assert isinstance(o.link_class_link_prop, model.link_class)
+
+    assert model.JSONLDSerializer().serialize_data(
+        merged
+    ) == model.JSONLDSerializer().serialize_data(objsets[0].merge(*objsets[1:]))
+
+
+def test_link_deep(model):
+    # Deeper than the Python recursion limit
+    depth = sys.getrecursionlimit() * 2
+
+    root = model.link_class()
+    o = root
+    for _ in range(depth):
+        child = model.link_class()
+        o.link_class_link_prop = child
+        o = child
+    o.link_class_link_prop = "http://example.org/end"
+
+    objset = model.SHACLObjectSet([root], link=True)
+    assert objset.missing_ids == {"http://example.org/end"}
+
+    end = objset.add(model.link_class(_id="http://example.org/end"))
+    assert o.link_class_link_prop is end
+    assert objset.missing_ids == set()
+
+
 def test_deprecated_class(model):
     with pytest.deprecated_call():
         model.test_deprecated_class()
@@ -1979,6 +2867,78 @@ def test_objset_context(model, context, expanded, compacted):
     assert expanded == objset.expand_iri(compacted, compacted)
 
 
+def test_objset_context_change(model):
+    objset = model.SHACLObjectSet()
+    objset.context = {"foo": "http://foo.example.com/"}
+    assert objset.expand_iri("foo:a") == "http://foo.example.com/a"
+    assert objset.compact_iri("http://bar.example.com/b") is None
+
+    # Cached results are discarded when the context changes
+    objset.context["foo"] = "http://foo2.example.com/"
+    objset.context.update({"bar": "http://bar.example.com/"})
+    assert objset.expand_iri("foo:a") == "http://foo2.example.com/a"
+    assert objset.compact_iri("http://bar.example.com/b") == "bar:b"
+
+    del objset.context["bar"]
+    assert objset.compact_iri("http://bar.example.com/b") is None
+
+
+def test_objset_context_assign(model):
+    objset = model.SHACLObjectSet()
+
+    # A mapping that is assigned is copied, so later changes to it are not
+    # used by the object set
+    context = {"foo": "http://foo.example.com/"}
+    objset.context = context
+    context["foo"] = "http://foo2.example.com/"
+    assert objset.context == {"foo": "http://foo.example.com/"}
+    assert objset.expand_iri("foo:a") == "http://foo.example.com/a"
+
+    # An IRIContext is used directly
+    context = model.IRIContext({"foo": "http://foo.example.com/"})
+    objset.context = context
+    assert objset.context is context
+    assert objset.expand_iri("foo:a") == "http://foo.example.com/a"
+    context["foo"] = "http://foo2.example.com/"
+    assert objset.expand_iri("foo:a") == "http://foo2.example.com/a"
+
+
+@pytest.mark.parametrize(
+    "mutate",
+    [
+        lambda c: c.__setitem__("foo", "http://foo2.example.com/"),
+        lambda c: c.__setitem__("baz", "http://foo.example.com/a"),
+        lambda c: c.__delitem__("foo"),
+        lambda c: c.__ior__({"bar": "http://foo.example.com/"}),
+        lambda c: c.clear(),
+        lambda c: c.pop("bar"),
+        lambda c: c.popitem(),
+        lambda c: c.setdefault("baz", "http://baz.example.com/"),
+        lambda c: c.update(bar="http://bar2.example.com/"),
+    ],
+)
+def test_iri_context_mutate(model, mutate):
+    context = model.IRIContext(
+        {"foo": "http://foo.example.com/", "bar": "http://bar.example.com/"}
+    )
+    iris = [
+        "foo:a",
+        "bar:b",
+        "baz:c",
+        "http://foo.example.com/a",
+        "http://bar.example.com/b",
+        "http://baz.example.com/c",
+    ]
+
+    def results(c):
+        return [(c.expand_iri(i), c.compact_iri(i)) for i in iris]
+
+    # Fill the caches, which must be discarded by every change
+    results(context)
+    mutate(context)
+    assert results(context) == results(model.IRIContext(dict(context)))
+
+
 def test_slots(model):
     assert model.model._USE_SLOTS
 